@@ -0,0 +1,20 @@
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+# Pick up .env here too, raw_env below is applied on top of it
+load_dotenv()
+
+# Run from the api directory so `main:app` and its local imports resolve
+chdir = os.path.dirname(os.path.abspath(__file__))
+bind = "0.0.0.0:8000"
+
+# Pre-forked uvicorn workers, each with its own event loop (uvloop when installed)
+worker_class = "uvicorn_worker.UvicornWorker"
+workers = multiprocessing.cpu_count() * 2
+keepalive = 5
+
+# Every worker connects its own MCP client pool in the app lifespan,
+# so keep the per-worker pool small unless POOL_SIZE is set explicitly
+raw_env = [f"POOL_SIZE={os.environ.get('POOL_SIZE', '2')}"]
@@ -1,96 +1,194 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
 from typing import Dict, Any
+import msgspec
 from contextlib import asynccontextmanager
-from mcp_client import MCPClient
+import asyncio
+import os
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
 
+# Load .env before the local modules so LOG_LEVEL reaches the logger
 load_dotenv()
 
+from mcp_client import MCPClient, encode_event
+from utils.logger import logger
+
 class Settings(BaseSettings):
     server_script_path: str = "/Users/alejandro/repos/code/mcp/documentation/main.py"
+    pool_size: int = (os.cpu_count() or 1) * 2
+    frontend_origin: str = "http://localhost:8501"
 
 settings = Settings()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    client = MCPClient()
+    logger.info(
+        f"Running on event loop: {asyncio.get_running_loop().__class__.__module__}"
+    )
+    clients = []
     try:
-        connected = await client.connect_to_server(settings.server_script_path)
-        if not connected:
-            raise Exception("Failed to connect to server")
-        app.state.client = client
+        # Each client owns its own MCP session and is checked out per request
+        pool = asyncio.Queue()
+        for _ in range(settings.pool_size):
+            client = MCPClient()
+            clients.append(client)
+            connected = await client.connect_to_server(settings.server_script_path)
+            if not connected:
+                raise Exception("Failed to connect to server")
+            pool.put_nowait(client)
+        app.state.clients = clients
+        app.state.pool = pool
         yield
     except Exception as e:
         raise Exception(f"Failed to connect to server: {str(e)}")
     finally:
         # Shutdown
-        await client.cleanup()
+        for client in reversed(clients):
+            await client.cleanup()
+
+@asynccontextmanager
+async def checkout_client():
+    """Take a client from the pool for the duration of a request"""
+    client = await app.state.pool.get()
+    try:
+        yield client
+    finally:
+        app.state.pool.put_nowait(client)
 
-app = FastAPI(title="MCP Chatbot API", lifespan=lifespan)
+app = FastAPI(
+    title="MCP Chatbot API",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Allows all origins
-    allow_credentials=True,
-    allow_methods=["*"],  # Allows all methods
-    allow_headers=["*"],  # Allows all headers
+    allow_origins=[settings.frontend_origin],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Authorization"],
+    max_age=86400,  # Browsers cache preflight responses for 24h
 )
 
-class QueryRequest(BaseModel):
-    query: str
+class EventStreamSkippingGZipMiddleware(GZipMiddleware):
+    """GZip responses, except the /query event stream which must flush each event"""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/query":
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+# Compress larger responses such as tool schemas and tool results
+app.add_middleware(
+    EventStreamSkippingGZipMiddleware, minimum_size=1024, compresslevel=5
+)
 
-class Message(BaseModel):
-    role: str
-    content: Any
+class QueryRequest(msgspec.Struct):
+    query: str
 
-class ToolCall(BaseModel):
+class ToolCall(msgspec.Struct):
     name: str
     args: Dict[str, Any]
 
-@app.get("/tools")
+# Decoders are reused across requests so types are only resolved once
+query_request_decoder = msgspec.json.Decoder(QueryRequest)
+tool_call_decoder = msgspec.json.Decoder(ToolCall)
+
+def request_body_schema(struct: type) -> dict:
+    """OpenAPI request body for a route that decodes its body with msgspec"""
+    # Inline the struct's schema, the OpenAPI doc has no $defs to point into
+    (_,), components = msgspec.json.schema_components([struct])
+    schema = components[struct.__name__]
+    return {"requestBody": {"content": {"application/json": {"schema": schema}}}}
+
+async def decode_body(request: Request, decoder: msgspec.json.Decoder):
+    """Parse and validate the raw request body in a single pass"""
+    try:
+        return decoder.decode(await request.body())
+    except msgspec.DecodeError as e:
+        # Same 422 body shape FastAPI produces for its own validation errors
+        raise RequestValidationError(
+            [{"loc": ("body",), "msg": str(e), "type": "value_error"}]
+        )
+
+@app.get("/tools", response_model=None)
 async def get_available_tools():
     """Get list of available tools"""
-    try:
-        tools = await app.state.client.get_mcp_tools()
-        return {
-            "tools": [
-                {
-                    "name": tool.name,
-                    "description": tool.description,
-                    "input_schema": tool.inputSchema,
-                }
-                for tool in tools
-            ]
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return Response(
+        content=app.state.clients[0].tools_payload,
+        media_type="application/json",
+    )
 
-@app.post("/query")
-async def process_query(request: QueryRequest):
-    """Process a query and return the response"""
+@app.post("/tools/refresh", response_model=None)
+async def refresh_tools():
+    """Reload the tool list from the MCP server"""
     try:
-        messages = []
-        messages = await app.state.client.process_query(request.query)
-        # async for message in app.state.client.process_query(request.query):
-        #     messages.append(message)
-        return {"messages": messages}
+        # Fetch once and swap every client's catalog in one step,
+        # so a failed fetch leaves the pool untouched
+        mcp_tools = await app.state.clients[0].get_mcp_tools()
+        for client in app.state.clients:
+            client.set_tools(mcp_tools)
+        return Response(
+            content=app.state.clients[0].tools_payload,
+            media_type="application/json",
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/tool")
-async def call_tool(tool_call: ToolCall):
+@app.post(
+    "/query",
+    response_model=None,
+    openapi_extra=request_body_schema(QueryRequest),
+)
+async def process_query(request: Request):
+    """Process a query and stream the response as server-sent events"""
+    query_request = await decode_body(request, query_request_decoder)
+
+    async def event_stream():
+        try:
+            async with checkout_client() as client:
+                async for event in client.process_query(query_request.query):
+                    yield f"data: {event}\n\n"
+        except Exception as e:
+            yield f"data: {encode_event({'type': 'error', 'detail': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+@app.post(
+    "/tool",
+    response_model=None,
+    openapi_extra=request_body_schema(ToolCall),
+)
+async def call_tool(request: Request):
     """Call a specific tool"""
+    tool_call = await decode_body(request, tool_call_decoder)
     try:
-        result = await app.state.client.call_tool(tool_call.name, tool_call.args)
-        return {"result": result}
+        async with checkout_client() as client:
+            result = await client.call_tool(tool_call.name, tool_call.args)
+        # Dump the MCP result directly instead of walking it with jsonable_encoder
+        return ORJSONResponse(
+            {"result": result.model_dump(mode="json", by_alias=True)}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        log_level="warning",
+    )
\ No newline at end of file
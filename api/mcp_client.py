@@ -1,15 +1,39 @@
 from typing import Optional
 from contextlib import AsyncExitStack
+import asyncio
+import logging
 import traceback
 from utils.logger import logger
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
-from datetime import datetime
-import json
+import hashlib
 import os
+import uuid
 
-from anthropic import Anthropic
-from anthropic.types import Message
+import aiofiles
+import orjson
+from cachetools import TTLCache
+
+from anthropic import AsyncAnthropic
+
+MODEL = "claude-3-5-sonnet-20241022"
+
+# Exact-match cache of LLM responses, keyed on the full request and
+# shared by every client in the pool
+_llm_cache = TTLCache(maxsize=1024, ttl=1800)
+
+
+def encode_event(event: dict) -> str:
+    """Encode a streamed query event as a JSON string"""
+    return orjson.dumps(event).decode()
+
+
+def dump_content(content: list) -> list:
+    """Convert MCP content models to JSON-ready dicts once, when a message is built"""
+    return [
+        item.model_dump(mode="json", by_alias=True, exclude_none=True)
+        for item in content
+    ]
 
 
 class MCPClient:
@@ -17,9 +41,9 @@ class MCPClient:
         # Initialize session and client objects
         self.session: Optional[ClientSession] = None
         self.exit_stack = AsyncExitStack()
-        self.llm = Anthropic()
+        self.llm = AsyncAnthropic()
         self.tools = []
-        self.messages = []
+        self.tools_payload = b'{"tools":[]}'
         self.logger = logger
 
     async def call_tool(self, tool_name: str, tool_args: dict):
@@ -60,24 +84,42 @@ class MCPClient:
             )
 
             await self.session.initialize()
-            mcp_tools = await self.get_mcp_tools()
-            self.tools = [
-                {
-                    "name": tool.name,
-                    "description": tool.description,
-                    "input_schema": tool.inputSchema,
-                }
-                for tool in mcp_tools
-            ]
+            os.makedirs("conversations", exist_ok=True)
+            await self.refresh_tools()
             self.logger.info(
                 f"Successfully connected to server. Available tools: {[tool['name'] for tool in self.tools]}"
             )
             return True
         except Exception as e:
             self.logger.error(f"Failed to connect to server: {str(e)}")
-            self.logger.debug(f"Connection error details: {traceback.format_exc()}")
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(
+                    "Connection error details: %s", traceback.format_exc()
+                )
             raise Exception(f"Failed to connect to server: {str(e)}")
 
+    async def refresh_tools(self):
+        """Fetch the tool catalog from the server and cache the /tools payload"""
+        self.set_tools(await self.get_mcp_tools())
+
+    def set_tools(self, mcp_tools: list):
+        """Use the given MCP tools for LLM calls and the /tools payload"""
+        self.tools = [
+            {
+                "name": tool.name,
+                "description": tool.description,
+                "input_schema": tool.inputSchema,
+            }
+            for tool in mcp_tools
+        ]
+        self.tools_payload = orjson.dumps({"tools": self.tools})
+        if self.tools:
+            # Breakpoint so Anthropic caches the stable tools prefix across turns
+            self.tools[-1] = {
+                **self.tools[-1],
+                "cache_control": {"type": "ephemeral"},
+            }
+
     async def get_mcp_tools(self):
         try:
             self.logger.info("Requesting MCP tools from the server.")
@@ -86,148 +128,154 @@ class MCPClient:
             return tools
         except Exception as e:
             self.logger.error(f"Failed to get MCP tools: {str(e)}")
-            self.logger.debug(f"Error details: {traceback.format_exc()}")
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Error details: %s", traceback.format_exc())
             raise Exception(f"Failed to get tools: {str(e)}")
 
-    async def call_llm(self) -> Message:
-        """Call the LLM with the given query"""
-        try:
-            return self.llm.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=1000,
-                messages=self.messages,
-                tools=self.tools,
-            )
-        except Exception as e:
-            self.logger.error(f"Failed to call LLM: {str(e)}")
-            raise Exception(f"Failed to call LLM: {str(e)}")
+    def _llm_cache_key(self, messages: list) -> str:
+        """Hash the model, messages and tools of the next LLM request"""
+        return hashlib.sha256(
+            orjson.dumps((MODEL, messages, self.tools))
+        ).hexdigest()
+
+    def _cached_response(self, key: str):
+        """Return the cached LLM response for the key, if any"""
+        return _llm_cache.get(key)
+
+    def _store_response(self, key: str, response):
+        """Cache an LLM response under the key"""
+        _llm_cache[key] = response
 
     async def process_query(self, query: str):
-        """Process a query using Claude and available tools, returning all messages at the end"""
+        """Process a query using Claude and available tools, streaming JSON-encoded events as they happen"""
+        log_file = None
         try:
             self.logger.info(
-                f"Processing new query: {query[:100]}..."
+                "Processing new query: %.100s...", query
             )  # Log first 100 chars of query
 
+            # One append-only log file per query, named by a unique query id
+            query_id = uuid.uuid4().hex
+            log_file = await aiofiles.open(f"conversations/{query_id}.jsonl", "ab")
+
             # Add the initial user message
             user_message = {"role": "user", "content": query}
-            self.messages.append(user_message)
-            await self.log_conversation(self.messages)
             messages = [user_message]
 
+            # Bind hot attributes once for the turn loop
+            messages_append = messages.append
+            log = self.log_conversation
+            call_tool = self.session.call_tool
+            info = self.logger.info
+
+            await log(log_file, user_message)
+            yield encode_event({"type": "message", "message": user_message})
+
             while True:
-                self.logger.debug("Calling Claude API")
-                response = await self.call_llm()
-
-                # If it's a simple text response
-                if response.content[0].type == "text" and len(response.content) == 1:
-                    assistant_message = {
-                        "role": "assistant",
-                        "content": response.content[0].text,
-                    }
-                    self.messages.append(assistant_message)
-                    await self.log_conversation(self.messages)
-                    messages.append(assistant_message)
-                    break
+                key = self._llm_cache_key(messages)
+                response = self._cached_response(key)
+                if response is None:
+                    self.logger.debug("Calling Claude API")
+                    async with self.llm.messages.stream(
+                        model=MODEL,
+                        max_tokens=1000,
+                        messages=messages,
+                        tools=self.tools,
+                    ) as stream:
+                        async for event in stream:
+                            if event.type == "text":
+                                yield encode_event(
+                                    {"type": "text", "text": event.text}
+                                )
+                        response = await stream.get_final_message()
+                    self._store_response(key, response)
+                else:
+                    self.logger.debug("Using cached Claude response")
+                    for content in response.content:
+                        if content.type == "text":
+                            yield encode_event({"type": "text", "text": content.text})
+
+                blocks = response.content
+                is_tool_use = response.stop_reason == "tool_use"
 
-                # For more complex responses with tool calls
-                assistant_message = {
-                    "role": "assistant",
-                    "content": response.to_dict()["content"],
-                }
-                self.messages.append(assistant_message)
-                await self.log_conversation(self.messages)
-                messages.append(assistant_message)
+                if is_tool_use:
+                    # Tool calls, possibly preceded by text
+                    assistant_content = response.to_dict()["content"]
+                else:
+                    # Final answer
+                    assistant_content = "".join(
+                        block.text for block in blocks if block.type == "text"
+                    )
+                assistant_message = {"role": "assistant", "content": assistant_content}
+                messages_append(assistant_message)
+                await log(log_file, assistant_message)
+                yield encode_event({"type": "message", "message": assistant_message})
 
-                for content in response.content:
+                if not is_tool_use:
+                    break
+
+                tool_calls = []
+                for content in blocks:
                     if content.type == "text":
                         # Text content within a complex response
                         text_message = {"role": "assistant", "content": content.text}
-                        await self.log_conversation(self.messages)
-                        messages.append(text_message)
+                        yield encode_event(
+                            {"type": "message", "message": text_message}
+                        )
                     elif content.type == "tool_use":
-                        tool_name = content.name
-                        tool_args = content.input
-                        tool_use_id = content.id
-
-                        self.logger.info(
-                            f"Executing tool: {tool_name} with args: {tool_args}"
+                        info(
+                            "Executing tool: %s with args: %s",
+                            content.name,
+                            content.input,
                         )
-                        try:
-                            # turn this one return a simple string
-                            result = await self.session.call_tool(tool_name, tool_args)
-                            self.logger.info(f"Tool result: {result}")
-                            # result = test_tool_result_content
-                            tool_result_message = {
-                                "role": "user",
-                                "content": [
-                                    {
-                                        "type": "tool_result",
-                                        "tool_use_id": tool_use_id,
-                                        "content": result.content,
-                                    }
-                                ],
-                            }
-                            self.messages.append(tool_result_message)
-                            await self.log_conversation(self.messages)
-                            messages.append(tool_result_message)
-                        except Exception as e:
-                            error_msg = f"Tool execution failed: {str(e)}"
-                            self.logger.error(error_msg)
-                            raise Exception(error_msg)
-
-            return messages
+                        tool_calls.append(content)
+
+                # Independent tool calls of a turn run concurrently
+                results = await asyncio.gather(
+                    *[call_tool(call.name, call.input) for call in tool_calls],
+                    return_exceptions=True,
+                )
+                tool_results = []
+                for call, result in zip(tool_calls, results):
+                    if isinstance(result, BaseException):
+                        error_msg = f"Tool execution failed: {str(result)}"
+                        self.logger.error(error_msg)
+                        raise Exception(error_msg)
+                    info("Tool result: %s", result)
+                    tool_results.append(
+                        {
+                            "type": "tool_result",
+                            "tool_use_id": call.id,
+                            "content": dump_content(result.content),
+                        }
+                    )
+
+                # All results of the turn go back in a single user message
+                tool_result_message = {"role": "user", "content": tool_results}
+                messages_append(tool_result_message)
+                await log(log_file, tool_result_message)
+                yield encode_event(
+                    {"type": "message", "message": tool_result_message}
+                )
 
         except Exception as e:
             self.logger.error(f"Error processing query: {str(e)}")
-            self.logger.debug(
-                f"Query processing error details: {traceback.format_exc()}"
-            )
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(
+                    "Query processing error details: %s", traceback.format_exc()
+                )
             raise
+        finally:
+            if log_file is not None:
+                await log_file.close()
 
-    async def log_conversation(self, conversation: list):
-        """Log the conversation to json file"""
-        # Create conversations directory if it doesn't exist
-        os.makedirs("conversations", exist_ok=True)
-
-        # Convert conversation to JSON-serializable format
-        serializable_conversation = []
-        for message in conversation:
-            try:
-                serializable_message = {
-                    "role": message["role"],
-                    "content": []
-                }
-                
-                # Handle both string and list content
-                if isinstance(message["content"], str):
-                    serializable_message["content"] = message["content"]                  
-                elif isinstance(message["content"], list):
-                    for content_item in message["content"]:
-                        if hasattr(content_item, 'to_dict'):
-                            serializable_message["content"].append(content_item.to_dict())
-                        elif hasattr(content_item, 'dict'):
-                            serializable_message["content"].append(content_item.dict())
-                        elif hasattr(content_item, 'model_dump'):
-                            serializable_message["content"].append(content_item.model_dump())
-                        else:
-                            serializable_message["content"].append(content_item)
-                
-                serializable_conversation.append(serializable_message)
-            except Exception as e:
-                self.logger.error(f"Error processing message: {str(e)}")
-                self.logger.debug(f"Message content: {message}")
-                raise
-
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filepath = os.path.join("conversations", f"conversation_{timestamp}.json")
-        
+    async def log_conversation(self, log_file, message: dict):
+        """Append a message to the query's jsonl log file"""
         try:
-            with open(filepath, "w") as f:
-                json.dump(serializable_conversation, f, indent=2, default=str)
+            await log_file.write(orjson.dumps(message) + b"\n")
         except Exception as e:
             self.logger.error(f"Error writing conversation to file: {str(e)}")
-            self.logger.debug(f"Serializable conversation: {serializable_conversation}")
+            self.logger.debug("Message content: %s", message)
             raise
 
     async def cleanup(self):
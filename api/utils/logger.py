@@ -1,9 +1,10 @@
 import logging
+import os
 import sys
 
 # Configure logging
 logger = logging.getLogger("MCPClient")
-logger.setLevel(logging.DEBUG)
+logger.setLevel(os.getenv("LOG_LEVEL", "DEBUG").upper())
 
 # File handler with DEBUG level
 file_handler = logging.FileHandler("mcp_client.log")
@@ -7,7 +7,7 @@ import json
 class Chatbot:
     def __init__(self, api_url: str):
         self.api_url = api_url
-        self.current_tool_call = {"name": None, "args": None}
+        self.tool_calls = {}
         self.messages = st.session_state["messages"]
 
     def display_message(self, message: Dict[str, Any]):
@@ -19,12 +19,15 @@ class Chatbot:
         if message["role"] == "user" and type(message["content"]) == list:
             for content in message["content"]:
                 if content["type"] == "tool_result":
+                    tool_call = self.tool_calls.get(
+                        content["tool_use_id"], {"name": None, "args": None}
+                    )
                     with st.chat_message("assistant"):
-                        st.write(f"Called tool: {self.current_tool_call['name']}:")
+                        st.write(f"Called tool: {tool_call['name']}:")
                         st.json(
                             {
-                                "name": self.current_tool_call["name"],
-                                "args": self.current_tool_call["args"],
+                                "name": tool_call["name"],
+                                "args": tool_call["args"],
                                 "content": json.loads(content["content"][0]["text"]),
                             },
                             expanded=False,
@@ -34,12 +37,12 @@ class Chatbot:
         if message["role"] == "assistant" and type(message["content"]) == str:
             st.chat_message("assistant").markdown(message["content"])
 
-        # store current ai tool use
+        # store ai tool uses, matched to their results by id
         if message["role"] == "assistant" and type(message["content"]) == list:
             for content in message["content"]:
                 # ai tool use
                 if content["type"] == "tool_use":
-                    self.current_tool_call = {
+                    self.tool_calls[content["id"]] = {
                         "name": content["name"],
                         "args": content["input"],
                     }
@@ -71,15 +74,32 @@ class Chatbot:
         if query:
             async with httpx.AsyncClient(timeout=60.0, verify=False) as client:
                 try:
-                    response = await client.post(
+                    async with client.stream(
+                        "POST",
                         f"{self.api_url}/query",
                         json={"query": query},
                         headers={"Content-Type": "application/json"},
-                    )
-                    if response.status_code == 200:
-                        messages = response.json()["messages"]
-                        st.session_state["messages"] = messages
-                        for message in st.session_state["messages"]:
-                            self.display_message(message)
+                    ) as response:
+                        if response.status_code == 200:
+                            messages = []
+                            streamed_text = ""
+                            placeholder = st.empty()
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data: "):
+                                    continue
+                                event = json.loads(line[len("data: "):])
+                                # partial ai text, rendered until the full message arrives
+                                if event["type"] == "text":
+                                    streamed_text += event["text"]
+                                    placeholder.markdown(streamed_text)
+                                elif event["type"] == "message":
+                                    placeholder.empty()
+                                    streamed_text = ""
+                                    messages.append(event["message"])
+                                    self.display_message(event["message"])
+                                    placeholder = st.empty()
+                                elif event["type"] == "error":
+                                    st.error(f"Backend: {event['detail']}")
+                            st.session_state["messages"] = messages
                 except Exception as e:
                     st.error(f"Frontend: Error processing query: {str(e)}")